@@ -12,22 +12,91 @@ from __future__ import annotations
 
 import hmac
 import os
-import re
+import threading
+import time
+import weakref
+from decimal import Decimal
 from functools import wraps
 from pathlib import Path
 
-from flask import Blueprint, Flask, Response, current_app, jsonify, request
-from sqlalchemy import inspect, text
-from sqlalchemy.engine import Engine
+import orjson
+from flask import Blueprint, Flask, Response, current_app, request
+from sqlalchemy import TextClause, inspect, text
+from sqlalchemy.engine import Connection, Engine, Inspector
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import NullPool, QueuePool
 
-__all__ = ["create_fenrir_bp", "secure_app"]
+__all__ = ["create_fenrir_bp", "refresh_api_key", "secure_app"]
 
 DEFAULT_ROW_LIMIT = 1000
 
-# Matches SELECT or WITH ... SELECT (the only read-only shapes we allow)
-_READ_ONLY_RE = re.compile(
-    r"^\s*(SELECT|WITH\s)", re.IGNORECASE | re.DOTALL
-)
+# Reflected /fenrir/schema payloads, keyed by engine. Cleared through
+# POST /fenrir/schema/refresh (e.g. after running migrations).
+_SCHEMA_CACHE: weakref.WeakKeyDictionary[Engine, dict] = weakref.WeakKeyDictionary()
+
+_SET_READ_ONLY = text("SET TRANSACTION READ ONLY")
+# Dialects known to accept SET TRANSACTION READ ONLY as the first statement
+# of a transaction; a failure there is an error, not something to skip.
+_READ_ONLY_DIALECTS = frozenset({"postgresql", "mysql", "mariadb", "oracle"})
+
+# FENRIR.md per app root_path: (path, mtime, contents, first heading)
+_FENRIR_MD_CACHE: dict[str, tuple[Path, float, str, str | None]] = {}
+
+# Tables counted per UNION ALL query (SQLite caps compound SELECTs at 500)
+_COUNT_BATCH_SIZE = 250
+
+
+def _json_default(obj):
+    """Serialize types orjson doesn't handle natively (e.g. NUMERIC columns)."""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError
+
+
+def _json(data, status: int = 200) -> Response:
+    """Encode a JSON response with orjson."""
+    return Response(
+        orjson.dumps(data, default=_json_default),
+        status=status,
+        mimetype="application/json",
+    )
+
+
+def _secrets_match(given: str, expected: str) -> bool:
+    """Constant-time comparison that also accepts non-ASCII input.
+
+    hmac.compare_digest raises TypeError on non-ASCII str, so compare bytes.
+    """
+    return hmac.compare_digest(given.encode(), expected.encode())
+
+
+def refresh_api_key(app: Flask) -> str | None:
+    """(Re)load FENRIR_API_KEY from the environment into ``app.config``.
+
+    The key is read once, on the first request that needs it, and then served
+    from ``app.config["FENRIR_API_KEY"]``. Call this after changing the
+    environment variable at runtime (e.g. in tests).
+    """
+    api_key = os.environ.get("FENRIR_API_KEY") or None
+    app.config["FENRIR_API_KEY"] = api_key
+    return api_key
+
+
+def _get_api_key(app: Flask) -> str | None:
+    """FENRIR_API_KEY from ``app.config``, loaded from the environment on first use."""
+    try:
+        return app.config["FENRIR_API_KEY"]
+    except KeyError:
+        return refresh_api_key(app)
+
+
+def _is_read_only(sql: str) -> bool:
+    """Accept SELECT or WITH ... SELECT (the only read-only shapes we allow)."""
+    s = sql.lstrip()
+    head = s[:6].upper()
+    if head == "SELECT":
+        return True
+    return head[:4] == "WITH" and len(s) > 4 and s[4].isspace()
 
 
 def _require_auth(f):
@@ -41,13 +110,13 @@ def _require_auth(f):
         if current_app.debug:
             return f(*args, **kwargs)
 
-        api_key = os.environ.get("FENRIR_API_KEY")
+        api_key = _get_api_key(current_app)
         if not api_key:
-            return jsonify({"error": "FENRIR_API_KEY not configured"}), 401
+            return _json({"error": "FENRIR_API_KEY not configured"}, 401)
 
         auth = request.headers.get("Authorization", "")
-        if not auth.startswith("Bearer ") or not hmac.compare_digest(auth[7:], api_key):
-            return jsonify({"error": "unauthorized"}), 401
+        if not auth.startswith("Bearer ") or not _secrets_match(auth[7:], api_key):
+            return _json({"error": "unauthorized"}, 401)
 
         return f(*args, **kwargs)
 
@@ -77,6 +146,13 @@ def secure_app(
     _skip_exact = {"/health"}
     if skip_paths:
         _skip.extend(skip_paths)
+    _skip_prefixes = tuple(_skip)
+
+    # WSGI environ key for the API key header, e.g. X-API-Key -> HTTP_X_API_KEY
+    _api_key_environ = None
+    if api_key_auth and api_key_auth.get("secret"):
+        header = api_key_auth.get("header", "")
+        _api_key_environ = "HTTP_" + header.upper().replace("-", "_")
 
     @app.before_request
     def _basic_auth_check():
@@ -85,24 +161,24 @@ def secure_app(
 
         # Skip excluded paths
         path = request.path
-        if any(path.startswith(p) for p in _skip) or path in _skip_exact:
+        if path.startswith(_skip_prefixes) or path in _skip_exact:
             return
         if request.endpoint == "static":
             return
 
-        api_key = os.environ.get("FENRIR_API_KEY")
+        api_key = _get_api_key(app)
         if not api_key:
             return Response("Not configured", 503)
 
         # Check API key header if configured (for MCP / programmatic access)
-        if api_key_auth and api_key_auth.get("secret"):
-            header_val = request.headers.get(api_key_auth.get("header", ""))
-            if header_val and hmac.compare_digest(header_val, api_key_auth["secret"]):
+        if _api_key_environ:
+            header_val = request.environ.get(_api_key_environ)
+            if header_val and _secrets_match(header_val, api_key_auth["secret"]):
                 return
 
         # Check basic auth — any username, password must match FENRIR_API_KEY
         auth = request.authorization
-        if auth and auth.password and hmac.compare_digest(auth.password, api_key):
+        if auth and auth.password and _secrets_match(auth.password, api_key):
             return
 
         return Response(
@@ -112,56 +188,275 @@ def secure_app(
         )
 
 
-def _read_fenrir_md() -> str | None:
-    """Read FENRIR.md from the app's root directory."""
-    root = Path(current_app.root_path)
+def _read_fenrir_md() -> tuple[str | None, str | None]:
+    """Read FENRIR.md from the app's root directory.
+
+    Returns ``(contents, first heading)``. The result is cached per root path
+    and only re-read when the file's mtime changes.
+    """
+    root = current_app.root_path
+    cached = _FENRIR_MD_CACHE.get(root)
+    if cached is not None:
+        path, mtime, md, heading = cached
+        try:
+            if path.stat().st_mtime == mtime:
+                return md, heading
+        except OSError:
+            pass
+
     # Walk up at most two levels — root_path is often the package dir,
     # FENRIR.md lives at the project root (next to pyproject.toml).
-    for base in [root, root.parent, root.parent.parent]:
+    root_dir = Path(root)
+    for base in [root_dir, root_dir.parent, root_dir.parent.parent]:
         candidate = base / "FENRIR.md"
         if candidate.is_file():
-            return candidate.read_text(encoding="utf-8")
+            mtime = candidate.stat().st_mtime
+            md = candidate.read_text(encoding="utf-8")
+            heading = _extract_heading(md)
+            _FENRIR_MD_CACHE[root] = (candidate, mtime, md, heading)
+            return md, heading
+
+    _FENRIR_MD_CACHE.pop(root, None)
+    return None, None
+
+
+def _extract_heading(md: str) -> str | None:
+    """Pull the first heading from FENRIR.md."""
+    for line in md.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("#"):
+            return stripped.lstrip("#").strip()
     return None
 
 
-def _extract_app_name(md: str | None, app_name: str) -> str:
-    """Pull the first heading from FENRIR.md, or fall back to Flask app name."""
-    if md:
-        for line in md.splitlines():
-            stripped = line.strip()
-            if stripped.startswith("#"):
-                return stripped.lstrip("#").strip()
-    return app_name
+def _build_count_queries(
+    engine: Engine, names: list[str]
+) -> list[tuple[list[str], TextClause]]:
+    """Build UNION ALL row-count queries, one per batch of tables."""
+    quote = engine.dialect.identifier_preparer.quote
+    queries = []
+    for start in range(0, len(names), _COUNT_BATCH_SIZE):
+        batch = names[start:start + _COUNT_BATCH_SIZE]
+        sql = " UNION ALL ".join(
+            f"SELECT {i} AS idx, COUNT(*) AS row_count FROM {quote(name)}"
+            for i, name in enumerate(batch)
+        )
+        queries.append((batch, text(sql)))
+    return queries
+
+
+def _count_rows(
+    conn: Connection, queries: list[tuple[list[str], TextClause]]
+) -> dict[str, int]:
+    """Run the queries from _build_count_queries and map table name to count."""
+    counts = {}
+    for batch, sql in queries:
+        for idx, count in conn.execute(sql):
+            counts[batch[idx]] = count
+    return counts
+
+
+def _reflect_schema(insp: Inspector, names: list[str]) -> dict:
+    """Introspect the given tables: columns, primary key, foreign keys, indexes.
+
+    Uses the get_multi_* APIs: one reflection pass per category for all
+    tables, keyed by (schema, table) with schema None for the default schema.
+    """
+    all_columns = insp.get_multi_columns(filter_names=names)
+    all_pks = insp.get_multi_pk_constraint(filter_names=names)
+    all_fks = insp.get_multi_foreign_keys(filter_names=names)
+    all_indexes = insp.get_multi_indexes(filter_names=names)
+    tables = {}
+
+    for table_name in names:
+        key = (None, table_name)
+        columns = []
+        for col in all_columns.get(key, []):
+            columns.append({
+                "name": col["name"],
+                "type": str(col["type"]),
+                "nullable": col.get("nullable", True),
+                "default": str(col["default"]) if col.get("default") is not None else None,
+            })
+
+        pk = all_pks.get(key)
+        fks = [
+            {
+                "columns": fk["constrained_columns"],
+                "referred_table": fk["referred_table"],
+                "referred_columns": fk["referred_columns"],
+            }
+            for fk in all_fks.get(key, [])
+        ]
+        indexes = [
+            {
+                "name": idx["name"],
+                "columns": idx["column_names"],
+                "unique": idx["unique"],
+            }
+            for idx in all_indexes.get(key, [])
+        ]
+
+        tables[table_name] = {
+            "columns": columns,
+            "primary_key": pk.get("constrained_columns", []) if pk else [],
+            "foreign_keys": fks,
+            "indexes": indexes,
+        }
 
+    return {"tables": tables}
 
-def create_fenrir_bp(engine: Engine, *, row_limit: int = DEFAULT_ROW_LIMIT) -> Blueprint:
+
+def create_fenrir_bp(
+    engine: Engine,
+    *,
+    row_limit: int = DEFAULT_ROW_LIMIT,
+    schema_cache: bool = True,
+) -> Blueprint:
     """Create and return the Fenrir API blueprint.
 
     Args:
         engine: SQLAlchemy engine to introspect and query.
         row_limit: Max rows returned by /fenrir/query (default 1000).
+        schema_cache: Cache the /fenrir/schema reflection per engine until
+            POST /fenrir/schema/refresh is called, and the table list for
+            FENRIR_TABLE_NAMES_TTL seconds (default 60). Default True.
     """
     bp = Blueprint("fenrir", __name__, url_prefix="/fenrir")
 
+    names_ttl = float(os.environ.get("FENRIR_TABLE_NAMES_TTL", 60)) if schema_cache else 0.0
+    # "tables" is a (names, count queries, reflection info_cache) snapshot.
+    # "generation" is bumped by /schema/refresh so that reflection started
+    # before a refresh can't overwrite what comes after it.
+    _state = {
+        "tables": ([], [], {}),
+        "expires": 0.0,
+        "generation": 0,
+        "warm_up_started": False,
+    }
+    warm_up_lock = threading.Lock()
+
+    # Resolved once here rather than on every /fenrir/query call
+    # SQLite has no SET TRANSACTION. Other dialects we don't know get it
+    # on a best-effort basis, like every dialect did before.
+    set_read_only = engine.dialect.name != "sqlite"
+    read_only_required = engine.dialect.name in _READ_ONLY_DIALECTS
+    fetch_size = row_limit + 1
+
+    # Static options for /fenrir/query, applied once rather than per request
+    query_engine = engine.execution_options(
+        postgresql_readonly=True,      # PostgreSQL
+        sqlite_raw_colnames=True,      # harmless on SQLite
+    )
+    # Server-side cursor for the user's statement only: the driver buffers
+    # just the rows we fetch, not the whole result set of an unbounded
+    # SELECT. Must not be set on the connection, or PostgreSQL would wrap
+    # every statement (SET TRANSACTION included) in DECLARE ... CURSOR.
+    stream_options = {"yield_per": fetch_size}
+
+    def _inspector(conn: Connection, info_cache: dict) -> Inspector:
+        """Inspector on the caller's connection, backed by a shared info_cache.
+
+        The info_cache deduplicates reflection queries across requests until
+        the table list is re-read.
+        """
+        insp = inspect(conn)
+        insp.info_cache = info_cache
+        return insp
+
+    def _get_tables(
+        conn: Connection,
+    ) -> tuple[list[str], list[tuple[list[str], TextClause]], dict]:
+        """Table names, row-count queries and info_cache, cached for names_ttl."""
+        now = time.monotonic()
+        if now < _state["expires"]:
+            return _state["tables"]
+
+        generation = _state["generation"]
+        info_cache = {}
+        names = sorted(_inspector(conn, info_cache).get_table_names())
+        tables = (names, _build_count_queries(engine, names), info_cache)
+        if _state["generation"] == generation:
+            _state["tables"] = tables
+            _state["expires"] = now + names_ttl
+        return tables
+
+    def _get_schema() -> dict:
+        """Reflected schema, served from _SCHEMA_CACHE when schema_cache is on."""
+        cached = _SCHEMA_CACHE.get(engine) if schema_cache else None
+        if cached is None:
+            generation = _state["generation"]
+            with engine.connect() as conn:
+                names, _, info_cache = _get_tables(conn)
+                cached = _reflect_schema(_inspector(conn, info_cache), names)
+            if schema_cache and _state["generation"] == generation:
+                _SCHEMA_CACHE[engine] = cached
+        return cached
+
+    @bp.record_once
+    def _register_warm_up(setup_state):
+        # Without caching every request reflects anyway; nothing to warm.
+        if not schema_cache:
+            return
+
+        # Warm up on the app's first request, not at registration: by then
+        # create_all()/migrations have run, and under a preforking server
+        # we are in the worker process rather than the parent.
+        logger = setup_state.app.logger
+
+        def run():
+            # Only primes the table list and its info_cache, which expire
+            # with names_ttl; _SCHEMA_CACHE is filled by the first
+            # /fenrir/schema request, without touching the database.
+            # A database that isn't reachable yet must not break the request.
+            try:
+                with engine.connect() as conn:
+                    names, _, info_cache = _get_tables(conn)
+                    _reflect_schema(_inspector(conn, info_cache), names)
+            except Exception as exc:
+                logger.warning("fenrir: schema warm-up failed: %s", exc)
+
+        @setup_state.app.before_request
+        def _start_warm_up():
+            if _state["warm_up_started"]:
+                return
+            with warm_up_lock:
+                if _state["warm_up_started"]:
+                    return
+                _state["warm_up_started"] = True
+            # Only pools that hand out a separate connection per checkout can
+            # be warmed off-thread. SingletonThreadPool (in-memory SQLite)
+            # gives each thread its own database, and StaticPool shares one
+            # connection whose rollback on return would discard the request's
+            # writes; those are warmed from the request thread.
+            if isinstance(engine.pool, (QueuePool, NullPool)):
+                threading.Thread(target=run, name="fenrir-warm-up", daemon=True).start()
+            else:
+                run()
+
     # -- GET /fenrir/ ----------------------------------------------------------
 
     @bp.route("/")
     @_require_auth
     def index():
-        md = _read_fenrir_md()
-        app_name = _extract_app_name(md, current_app.name)
+        md, heading = _read_fenrir_md()
+        app_name = heading or current_app.name
 
-        # Table list with row counts
-        insp = inspect(engine)
-        tables = []
+        # Table list with row counts, reflected and counted on one connection
         with engine.connect() as conn:
-            for table_name in sorted(insp.get_table_names()):
-                count = conn.execute(
-                    text(f'SELECT COUNT(*) FROM "{table_name}"')
-                ).scalar()
-                tables.append({"name": table_name, "row_count": count})
+            names, count_queries, _ = _get_tables(conn)
+            try:
+                counts = _count_rows(conn, count_queries)
+            except DBAPIError:
+                # A cached table may have been dropped or renamed since:
+                # re-read the table list once and count again.
+                conn.rollback()
+                _state["expires"] = 0.0
+                names, count_queries, _ = _get_tables(conn)
+                counts = _count_rows(conn, count_queries)
+        tables = [{"name": name, "row_count": counts[name]} for name in names]
 
-        return jsonify({
+        return _json({
             "app": app_name,
             "fenrir_md": md,
             "tables": tables,
@@ -172,84 +467,68 @@ def create_fenrir_bp(engine: Engine, *, row_limit: int = DEFAULT_ROW_LIMIT) -> B
     @bp.route("/schema")
     @_require_auth
     def schema():
-        insp = inspect(engine)
-        tables = {}
-
-        for table_name in sorted(insp.get_table_names()):
-            columns = []
-            for col in insp.get_columns(table_name):
-                columns.append({
-                    "name": col["name"],
-                    "type": str(col["type"]),
-                    "nullable": col.get("nullable", True),
-                    "default": str(col["default"]) if col.get("default") is not None else None,
-                })
-
-            pk = insp.get_pk_constraint(table_name)
-            fks = [
-                {
-                    "columns": fk["constrained_columns"],
-                    "referred_table": fk["referred_table"],
-                    "referred_columns": fk["referred_columns"],
-                }
-                for fk in insp.get_foreign_keys(table_name)
-            ]
-            indexes = [
-                {
-                    "name": idx["name"],
-                    "columns": idx["column_names"],
-                    "unique": idx["unique"],
-                }
-                for idx in insp.get_indexes(table_name)
-            ]
-
-            tables[table_name] = {
-                "columns": columns,
-                "primary_key": pk.get("constrained_columns", []) if pk else [],
-                "foreign_keys": fks,
-                "indexes": indexes,
-            }
+        return _json(_get_schema())
 
-        return jsonify({"tables": tables})
+    # -- POST /fenrir/schema/refresh -------------------------------------------
+
+    @bp.route("/schema/refresh", methods=["POST"])
+    @_require_auth
+    def schema_refresh():
+        _state["generation"] += 1
+        _state["expires"] = 0.0
+        _SCHEMA_CACHE.pop(engine, None)
+        return _json({"refreshed": True})
 
     # -- POST /fenrir/query ----------------------------------------------------
 
     @bp.route("/query", methods=["POST"])
     @_require_auth
     def query():
-        body = request.get_json(silent=True) or {}
-        sql = body.get("sql", "").strip()
+        # Parse the raw bytes in one pass; invalid JSON counts as no body,
+        # like get_json(silent=True) did. Bodies that can't contain the
+        # "sql" key (empty, {}, ...) are rejected without parsing.
+        raw = request.get_data(cache=False)
+        if b'"sql"' not in raw:
+            return _json({"error": "missing 'sql' field"}, 400)
+        try:
+            body = orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            body = {}
+        sql = body.get("sql") if isinstance(body, dict) else None
+        sql = sql.strip() if isinstance(sql, str) else ""
 
         if not sql:
-            return jsonify({"error": "missing 'sql' field"}), 400
+            return _json({"error": "missing 'sql' field"}, 400)
 
-        if not _READ_ONLY_RE.match(sql):
-            return jsonify({"error": "only SELECT (or WITH ... SELECT) allowed"}), 400
+        if not _is_read_only(sql):
+            return _json({"error": "only SELECT (or WITH ... SELECT) allowed"}, 400)
 
         try:
-            with engine.connect().execution_options(
-                postgresql_readonly=True,      # PostgreSQL
-                sqlite_raw_colnames=True,      # harmless on SQLite
-            ) as conn:
-                conn.begin()
-                # SET TRANSACTION READ ONLY works on PostgreSQL.
-                # SQLite doesn't support it, so we skip errors silently.
-                try:
-                    conn.execute(text("SET TRANSACTION READ ONLY"))
-                except Exception:
-                    pass
-                result = conn.execute(text(sql))
+            with query_engine.connect() as conn:
+                # SET TRANSACTION READ ONLY must be the first statement of the
+                # (autobegun) transaction, and never go through a server-side
+                # cursor.
+                if set_read_only:
+                    try:
+                        conn.execute(_SET_READ_ONLY, execution_options={"stream_results": False})
+                    except Exception:
+                        if read_only_required:
+                            raise
+                        # Start over in a clean transaction without it
+                        conn.rollback()
+                result = conn.execute(text(sql), execution_options=stream_options)
                 columns = list(result.keys())
-                rows = [list(r) for r in result.fetchmany(row_limit)]
+                # Fetch one row past the limit to detect truncation
+                fetched = result.fetchmany(fetch_size)
+                truncated = len(fetched) > row_limit
+                # orjson encodes tuples as arrays; Row itself isn't serializable
+                rows = list(map(tuple, fetched[:row_limit]))
                 total = len(rows)
-                # Check if there were more rows we didn't fetch
-                extra = result.fetchone()
-                truncated = extra is not None
                 conn.rollback()
         except Exception as exc:
-            return jsonify({"error": str(exc)}), 422
+            return _json({"error": str(exc)}, 422)
 
-        return jsonify({
+        return _json({
             "columns": columns,
             "rows": rows,
             "row_count": total,
@@ -4,15 +4,20 @@ from __future__ import annotations
 
 import json
 import os
+import sqlite3
 import tempfile
+import threading
+from datetime import date
+from decimal import Decimal
 from pathlib import Path
 
 import pytest
 from flask import Flask
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import StaticPool
 from sqlmodel import Field, Session, SQLModel
 
-from flask_fenrir import create_fenrir_bp, secure_app
+from flask_fenrir import create_fenrir_bp, refresh_api_key, secure_app
 
 # ---------------------------------------------------------------------------
 # Models
@@ -90,6 +95,10 @@ class TestAuth:
         r = client.get("/fenrir/", headers={"Authorization": "Bearer wrong"})
         assert r.status_code == 401
 
+    def test_non_ascii_key_rejected(self, client):
+        r = client.get("/fenrir/", headers={"Authorization": "Bearer clé"})
+        assert r.status_code == 401
+
     def test_correct_key(self, client):
         r = client.get("/fenrir/", headers=auth_headers())
         assert r.status_code == 200
@@ -99,6 +108,23 @@ class TestAuth:
         r = client.get("/fenrir/", headers={"Authorization": "Bearer anything"})
         assert r.status_code == 401
 
+    def test_key_cached_until_refresh(self, app, client):
+        assert client.get("/fenrir/", headers=auth_headers()).status_code == 200
+
+        os.environ["FENRIR_API_KEY"] = "rotated"
+        assert client.get("/fenrir/", headers=auth_headers()).status_code == 200
+
+        refresh_api_key(app)
+        assert client.get("/fenrir/", headers=auth_headers()).status_code == 401
+        r = client.get("/fenrir/", headers={"Authorization": "Bearer rotated"})
+        assert r.status_code == 200
+
+    def test_key_from_config(self, app, client):
+        os.environ.pop("FENRIR_API_KEY", None)
+        app.config["FENRIR_API_KEY"] = "from-config"
+        r = client.get("/fenrir/", headers={"Authorization": "Bearer from-config"})
+        assert r.status_code == 200
+
     def test_debug_mode_skips_auth(self, app):
         app.debug = True
         with app.test_client() as c:
@@ -127,6 +153,18 @@ class TestIndex:
         assert any(t["name"] == "author" for t in data["tables"])
         assert any(t["name"] == "book" for t in data["tables"])
 
+    def test_fenrir_md_reloaded_on_change(self, app, client, tmp_path):
+        r = client.get("/fenrir/", headers=auth_headers())
+        assert r.get_json()["app"] == "Bookstore"
+
+        fenrir_md = tmp_path / "FENRIR.md"
+        fenrir_md.write_text("# Library\n")
+        st = fenrir_md.stat()
+        os.utime(fenrir_md, (st.st_atime, st.st_mtime + 10))
+
+        r = client.get("/fenrir/", headers=auth_headers())
+        assert r.get_json()["app"] == "Library"
+
     def test_row_counts(self, client):
         r = client.get("/fenrir/", headers=auth_headers())
         data = r.get_json()
@@ -135,6 +173,69 @@ class TestIndex:
         assert authors["row_count"] == 1
         assert books["row_count"] == 1
 
+    def test_row_counts_many_tables(self, tmp_path):
+        """Counts stay correct across UNION ALL batches."""
+        engine = create_engine("sqlite://")
+        with engine.begin() as conn:
+            for i in range(300):
+                conn.execute(text(f'CREATE TABLE "t{i:03d}" (id INTEGER)'))
+                conn.execute(text(f'INSERT INTO "t{i:03d}" VALUES (1)' + ", (1)" * (i % 3)))
+
+        app = Flask(__name__, root_path=str(tmp_path))
+        app.config["TESTING"] = True
+        app.register_blueprint(create_fenrir_bp(engine))
+
+        os.environ["FENRIR_API_KEY"] = API_KEY
+        with app.test_client() as c:
+            r = c.get("/fenrir/", headers=auth_headers())
+            tables = r.get_json()["tables"]
+            assert len(tables) == 300
+            for t in tables:
+                assert t["row_count"] == int(t["name"][1:]) % 3 + 1
+        os.environ.pop("FENRIR_API_KEY", None)
+
+    def test_single_connection(self, tmp_path):
+        """Reflection and row counts share one pooled connection."""
+        engine = create_engine("sqlite://")
+        SQLModel.metadata.create_all(engine)
+
+        app = Flask(__name__, root_path=str(tmp_path))
+        app.config["TESTING"] = True
+        # No caching, so every request reflects the table list
+        app.register_blueprint(create_fenrir_bp(engine, schema_cache=False))
+
+        checkouts = []
+        os.environ["FENRIR_API_KEY"] = API_KEY
+        with app.test_client() as c:
+            c.get("/fenrir/", headers=auth_headers())
+            event.listen(engine, "checkout", lambda *args: checkouts.append(1))
+            r = c.get("/fenrir/", headers=auth_headers())
+            assert r.status_code == 200
+        os.environ.pop("FENRIR_API_KEY", None)
+        assert len(checkouts) == 1
+
+    def test_dropped_table(self, tmp_path):
+        """A table dropped while the table list is cached is not counted."""
+        engine = create_engine("sqlite://")
+        SQLModel.metadata.create_all(engine)
+
+        app = Flask(__name__, root_path=str(tmp_path))
+        app.config["TESTING"] = True
+        app.register_blueprint(create_fenrir_bp(engine))
+
+        os.environ["FENRIR_API_KEY"] = API_KEY
+        with app.test_client() as c:
+            r = c.get("/fenrir/", headers=auth_headers())
+            assert [t["name"] for t in r.get_json()["tables"]] == ["author", "book"]
+
+            with engine.begin() as conn:
+                conn.execute(text("DROP TABLE book"))
+
+            r = c.get("/fenrir/", headers=auth_headers())
+            assert r.status_code == 200
+            assert [t["name"] for t in r.get_json()["tables"]] == ["author"]
+        os.environ.pop("FENRIR_API_KEY", None)
+
     def test_no_fenrir_md(self, tmp_path):
         """When FENRIR.md doesn't exist, fenrir_md should be null."""
         empty_dir = tmp_path / "empty"
@@ -188,6 +289,160 @@ class TestSchema:
         fk = book["foreign_keys"][0]
         assert fk["referred_table"] == "author"
 
+    def _schema_app(self, tmp_path, **kwargs):
+        engine = create_engine("sqlite://")
+        SQLModel.metadata.create_all(engine)
+
+        app = Flask(__name__, root_path=str(tmp_path))
+        app.config["TESTING"] = True
+        app.register_blueprint(create_fenrir_bp(engine, **kwargs))
+        return app, engine
+
+    def test_cached_until_refresh(self, tmp_path):
+        app, engine = self._schema_app(tmp_path)
+
+        os.environ["FENRIR_API_KEY"] = API_KEY
+        with app.test_client() as c:
+            r = c.get("/fenrir/schema", headers=auth_headers())
+            assert "publisher" not in r.get_json()["tables"]
+
+            with engine.begin() as conn:
+                conn.execute(text("CREATE TABLE publisher (id INTEGER PRIMARY KEY)"))
+
+            r = c.get("/fenrir/schema", headers=auth_headers())
+            assert "publisher" not in r.get_json()["tables"]
+
+            r = c.post("/fenrir/schema/refresh", headers=auth_headers())
+            assert r.status_code == 200
+
+            r = c.get("/fenrir/schema", headers=auth_headers())
+            assert "publisher" in r.get_json()["tables"]
+        os.environ.pop("FENRIR_API_KEY", None)
+
+    def test_refresh_updates_table_list(self, tmp_path):
+        app, engine = self._schema_app(tmp_path)
+
+        os.environ["FENRIR_API_KEY"] = API_KEY
+        with app.test_client() as c:
+            c.get("/fenrir/", headers=auth_headers())
+            with engine.begin() as conn:
+                conn.execute(text("CREATE TABLE publisher (id INTEGER PRIMARY KEY)"))
+
+            r = c.get("/fenrir/", headers=auth_headers())
+            assert "publisher" not in [t["name"] for t in r.get_json()["tables"]]
+
+            c.post("/fenrir/schema/refresh", headers=auth_headers())
+            r = c.get("/fenrir/", headers=auth_headers())
+            assert "publisher" in [t["name"] for t in r.get_json()["tables"]]
+        os.environ.pop("FENRIR_API_KEY", None)
+
+    def test_tables_created_after_registration(self, tmp_path):
+        """The usual factory order: register the blueprint, then create_all()."""
+        engine = create_engine("sqlite://")
+        app = Flask(__name__, root_path=str(tmp_path))
+        app.config["TESTING"] = True
+        app.register_blueprint(create_fenrir_bp(engine))
+        SQLModel.metadata.create_all(engine)
+
+        os.environ["FENRIR_API_KEY"] = API_KEY
+        with app.test_client() as c:
+            r = c.get("/fenrir/", headers=auth_headers())
+            assert {t["name"] for t in r.get_json()["tables"]} == {"author", "book"}
+            r = c.get("/fenrir/schema", headers=auth_headers())
+            assert set(r.get_json()["tables"]) == {"author", "book"}
+        os.environ.pop("FENRIR_API_KEY", None)
+
+    def test_cache_disabled(self, tmp_path):
+        app, engine = self._schema_app(tmp_path, schema_cache=False)
+
+        os.environ["FENRIR_API_KEY"] = API_KEY
+        with app.test_client() as c:
+            c.get("/fenrir/schema", headers=auth_headers())
+            with engine.begin() as conn:
+                conn.execute(text("CREATE TABLE publisher (id INTEGER PRIMARY KEY)"))
+
+            r = c.get("/fenrir/schema", headers=auth_headers())
+            assert "publisher" in r.get_json()["tables"]
+        os.environ.pop("FENRIR_API_KEY", None)
+
+    def test_warm_up_in_background_thread(self, tmp_path):
+        """The first request warms reflection off-thread; /schema then runs no SQL."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+
+        app = Flask(__name__, root_path=str(tmp_path))
+        app.config["TESTING"] = True
+        app.register_blueprint(create_fenrir_bp(engine))
+        SQLModel.metadata.create_all(engine)
+
+        @app.route("/health")
+        def health():
+            return "ok"
+
+        executed = []
+        os.environ["FENRIR_API_KEY"] = API_KEY
+        with app.test_client() as c:
+            c.get("/health")
+            warm_ups = [t for t in threading.enumerate() if t.name == "fenrir-warm-up"]
+            assert warm_ups
+            for t in warm_ups:
+                t.join()
+
+            event.listen(
+                engine,
+                "before_cursor_execute",
+                lambda conn, cursor, statement, *args: executed.append(statement),
+            )
+            r = c.get("/fenrir/schema", headers=auth_headers())
+            assert set(r.get_json()["tables"]) == {"author", "book"}
+        os.environ.pop("FENRIR_API_KEY", None)
+        engine.dispose()
+        assert executed == []
+
+    def test_warm_up_inline_on_static_pool(self, tmp_path):
+        """StaticPool shares one connection, so it is warmed on the request thread."""
+        engine = create_engine(
+            "sqlite://",
+            poolclass=StaticPool,
+            connect_args={"check_same_thread": False},
+        )
+        SQLModel.metadata.create_all(engine)
+
+        app = Flask(__name__, root_path=str(tmp_path))
+        app.config["TESTING"] = True
+        app.register_blueprint(create_fenrir_bp(engine))
+
+        @app.route("/authors", methods=["POST"])
+        def add_author():
+            with Session(engine) as session:
+                session.add(Author(name="Tolkien"))
+                session.commit()
+            return "ok"
+
+        threads = set()
+        event.listen(
+            engine,
+            "before_cursor_execute",
+            lambda *args: threads.add(threading.current_thread().name),
+        )
+        os.environ["FENRIR_API_KEY"] = API_KEY
+        with app.test_client() as c:
+            c.post("/authors")
+            for t in threading.enumerate():
+                if t.name == "fenrir-warm-up":
+                    t.join()
+            r = c.post(
+                "/fenrir/query",
+                json={"sql": "SELECT name FROM author"},
+                headers=auth_headers(),
+            )
+            assert r.get_json()["rows"] == [["Tolkien"]]
+        os.environ.pop("FENRIR_API_KEY", None)
+        assert threads == {threading.current_thread().name}
+
+    def test_refresh_requires_auth(self, client):
+        r = client.post("/fenrir/schema/refresh")
+        assert r.status_code == 401
+
 
 # ---------------------------------------------------------------------------
 # POST /fenrir/query
@@ -216,6 +471,23 @@ class TestQuery:
         assert r.status_code == 200
         assert r.get_json()["row_count"] == 1
 
+    def test_select_case_insensitive(self, client):
+        r = client.post(
+            "/fenrir/query",
+            json={"sql": "  select name from author"},
+            headers=auth_headers(),
+        )
+        assert r.status_code == 200
+        assert r.get_json()["rows"] == [["Tolkien"]]
+
+    def test_rejects_with_prefix_word(self, client):
+        r = client.post(
+            "/fenrir/query",
+            json={"sql": "WITHOUT SELECT 1"},
+            headers=auth_headers(),
+        )
+        assert r.status_code == 400
+
     def test_rejects_insert(self, client):
         r = client.post(
             "/fenrir/query",
@@ -236,6 +508,19 @@ class TestQuery:
         r = client.post("/fenrir/query", json={}, headers=auth_headers())
         assert r.status_code == 400
 
+    def test_invalid_json_body(self, client):
+        r = client.post(
+            "/fenrir/query",
+            data="not json",
+            content_type="application/json",
+            headers=auth_headers(),
+        )
+        assert r.status_code == 400
+
+    def test_non_object_body(self, client):
+        r = client.post("/fenrir/query", json=["SELECT 1"], headers=auth_headers())
+        assert r.status_code == 400
+
     def test_row_limit(self, tmp_path):
         """Row limit caps the number of returned rows."""
         engine = create_engine("sqlite://")
@@ -263,6 +548,54 @@ class TestQuery:
             assert data["row_limit"] == 3
         os.environ.pop("FENRIR_API_KEY", None)
 
+    def test_row_limit_exactly_reached(self, tmp_path):
+        """Exactly row_limit rows is not truncated."""
+        engine = create_engine("sqlite://")
+        SQLModel.metadata.create_all(engine)
+
+        with Session(engine) as session:
+            for i in range(3):
+                session.add(Author(name=f"Author {i}"))
+            session.commit()
+
+        app = Flask(__name__, root_path=str(tmp_path))
+        app.config["TESTING"] = True
+        app.register_blueprint(create_fenrir_bp(engine, row_limit=3))
+
+        os.environ["FENRIR_API_KEY"] = API_KEY
+        with app.test_client() as c:
+            r = c.post(
+                "/fenrir/query",
+                json={"sql": "SELECT * FROM author"},
+                headers=auth_headers(),
+            )
+            data = r.get_json()
+            assert data["row_count"] == 3
+            assert data["truncated"] is False
+        os.environ.pop("FENRIR_API_KEY", None)
+
+    def test_decimal_and_date_values(self, tmp_path, monkeypatch):
+        """Decimals are encoded as strings and dates as ISO 8601."""
+        monkeypatch.setitem(sqlite3.converters, "DECIMAL", lambda b: Decimal(b.decode()))
+        monkeypatch.setitem(sqlite3.converters, "DATE", lambda b: date.fromisoformat(b.decode()))
+        engine = create_engine(
+            "sqlite://", connect_args={"detect_types": sqlite3.PARSE_COLNAMES}
+        )
+
+        app = Flask(__name__, root_path=str(tmp_path))
+        app.config["TESTING"] = True
+        app.register_blueprint(create_fenrir_bp(engine))
+
+        os.environ["FENRIR_API_KEY"] = API_KEY
+        with app.test_client() as c:
+            sql = """SELECT '1.50' AS "price [decimal]", '2024-01-02' AS "published [date]" """
+            r = c.post("/fenrir/query", json={"sql": sql}, headers=auth_headers())
+            assert r.status_code == 200
+            data = r.get_json()
+            assert data["columns"] == ["price", "published"]
+            assert data["rows"] == [["1.50", "2024-01-02"]]
+        os.environ.pop("FENRIR_API_KEY", None)
+
     def test_bad_sql(self, client):
         r = client.post(
             "/fenrir/query",
@@ -271,6 +604,42 @@ class TestQuery:
         )
         assert r.status_code == 422
 
+    def _query_statements(self, tmp_path, dialect_name=None):
+        """Statements executed by one /fenrir/query call."""
+        engine = create_engine("sqlite://")
+        SQLModel.metadata.create_all(engine)
+        if dialect_name:
+            engine.dialect.name = dialect_name
+
+        app = Flask(__name__, root_path=str(tmp_path))
+        app.config["TESTING"] = True
+        # No caching, so no warm-up reflection on the first request
+        app.register_blueprint(create_fenrir_bp(engine, schema_cache=False))
+
+        executed = []
+        event.listen(
+            engine, "before_cursor_execute",
+            lambda conn, cursor, statement, *args: executed.append(statement),
+        )
+        os.environ["FENRIR_API_KEY"] = API_KEY
+        with app.test_client() as c:
+            r = c.post(
+                "/fenrir/query",
+                json={"sql": "SELECT name FROM author"},
+                headers=auth_headers(),
+            )
+            assert r.status_code == 200
+        os.environ.pop("FENRIR_API_KEY", None)
+        return executed
+
+    def test_no_set_transaction_on_sqlite(self, tmp_path):
+        assert self._query_statements(tmp_path) == ["SELECT name FROM author"]
+
+    def test_set_transaction_failure_ignored_on_unknown_dialect(self, tmp_path):
+        """Dialects we don't know get SET TRANSACTION READ ONLY best-effort."""
+        executed = self._query_statements(tmp_path, dialect_name="somedb")
+        assert executed == ["SET TRANSACTION READ ONLY", "SELECT name FROM author"]
+
 
 # ---------------------------------------------------------------------------
 # secure_app
@@ -326,6 +695,10 @@ class TestSecureApp:
         r = secured_client.get("/dashboard", headers=self._basic_auth_headers(password="wrong"))
         assert r.status_code == 401
 
+    def test_non_ascii_password_rejected(self, secured_client):
+        r = secured_client.get("/dashboard", headers=self._basic_auth_headers(password="clé"))
+        assert r.status_code == 401
+
     def test_any_username_accepted(self, secured_client):
         r = secured_client.get("/dashboard", headers=self._basic_auth_headers(username="bob"))
         assert r.status_code == 200
@@ -475,3 +848,65 @@ class TestSecureApp:
             assert r.status_code == 401
         os.environ.pop("FENRIR_API_KEY", None)
 
+
+# ---------------------------------------------------------------------------
+# PostgreSQL (only when FENRIR_TEST_POSTGRES_URL is set)
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.skipif(
+    not os.environ.get("FENRIR_TEST_POSTGRES_URL"),
+    reason="FENRIR_TEST_POSTGRES_URL not set",
+)
+class TestPostgres:
+    @pytest.fixture()
+    def pg_engine(self):
+        engine = create_engine(os.environ["FENRIR_TEST_POSTGRES_URL"])
+        SQLModel.metadata.drop_all(engine)
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            session.add(Author(name="Tolkien"))
+            session.commit()
+        yield engine
+        SQLModel.metadata.drop_all(engine)
+        engine.dispose()
+
+    @pytest.fixture()
+    def pg_client(self, pg_engine, tmp_path):
+        app = Flask(__name__, root_path=str(tmp_path))
+        app.config["TESTING"] = True
+        app.register_blueprint(create_fenrir_bp(pg_engine))
+
+        os.environ["FENRIR_API_KEY"] = API_KEY
+        yield app.test_client()
+        os.environ.pop("FENRIR_API_KEY", None)
+
+    def test_only_user_statement_uses_server_side_cursor(self, pg_engine, pg_client):
+        executed = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            executed.append((statement, context._is_server_side))
+
+        event.listen(pg_engine, "before_cursor_execute", record)
+        try:
+            r = pg_client.post(
+                "/fenrir/query",
+                json={"sql": "SELECT name FROM author"},
+                headers=auth_headers(),
+            )
+        finally:
+            event.remove(pg_engine, "before_cursor_execute", record)
+
+        assert r.status_code == 200, r.get_json()
+        assert r.get_json()["rows"] == [["Tolkien"]]
+        assert ("SET TRANSACTION READ ONLY", False) in executed
+        assert ("SELECT name FROM author", True) in executed
+
+    def test_transaction_is_read_only(self, pg_client):
+        r = pg_client.post(
+            "/fenrir/query",
+            json={"sql": "SELECT nextval('author_id_seq')"},
+            headers=auth_headers(),
+        )
+        assert r.status_code == 422
+        assert "read-only transaction" in r.get_json()["error"]